@@ -0,0 +1,589 @@
+const fs = require("fs");
+
+// Cross-workspace relay: re-posts messages between paired channels, keeping threads and order intact
+const RELAY_TS_MAP_TTL_SECONDS = 30 * 24 * 60 * 60;
+const RELAY_TS_MAP_MAX_ENTRIES = 250000;
+const RELAY_TS_MAP_COMPACT_MIN_LINES = 10000;
+const RELAY_TS_MAP_COMPACT_CHUNK = 5000;
+const RELAY_TS_MAP_FLUSH_MS = 2000;
+const RELAY_SLOW_POST_WARN_MS = 5000;
+const RELAY_RATE_LIMIT_MAX_ATTEMPTS = 10;
+const RELAY_POSTS_PER_SECOND = 1;
+const RELAY_POST_BURST = 2;
+// ErrorCode.RateLimitedError from @slack/web-api, raised when rejectRateLimitedCalls is set
+const RATE_LIMITED_ERROR_CODE = "slack_webapi_rate_limited_error";
+const RELAY_BATCH_MAX_MESSAGES = 20;
+// Slack recommends keeping text under 4,000 characters and rejects posts well past 40,000 (msg_too_long)
+const RELAY_BATCH_MAX_CHARS = 4000;
+const RELAY_POST_MAX_CHARS = 40000;
+// Room for the "[channel] author: " prefix and line break when sizing a batch
+const RELAY_LINE_OVERHEAD_CHARS = 100;
+const RELAY_USER_CACHE_TTL_SECONDS = 15 * 60;
+const RELAY_USER_MISS_TTL_SECONDS = 30;
+const RELAYABLE_SUBTYPES = new Set([undefined, "thread_broadcast", "file_share", "me_message"]);
+
+function relayKey(teamId, channelId, ts) {
+  return `${teamId}:${channelId}:${ts}`;
+}
+
+function logTime() {
+  return new Date().toISOString().replace("T", " ").split(".")[0];
+}
+
+function describeFiles(files) {
+  return (files || [])
+    .map((file) => {
+      const name = file.name || file.title || "attachment";
+      return file.permalink ? `<${file.permalink}|${name}>` : name;
+    })
+    .join("\n");
+}
+
+function messageBody(event) {
+  return [event.text || "", describeFiles(event.files)].filter(Boolean).join("\n");
+}
+
+function loadRelayRules(config, teamAliases = {}) {
+  // Expands the JSON rule config ([{ source: "rtc#test-client", target: "beta#test-channel", bidirectional }])
+  // into one rule per direction; team may be an alias from teamAliases or a raw team_id
+  let entries;
+  try {
+    entries = JSON.parse(config);
+  } catch (err) {
+    throw new Error(`Relay rules are not valid JSON: ${err.message}`);
+  }
+  if (!Array.isArray(entries) || !entries.length) {
+    throw new Error("Relay rules must be a non-empty JSON array");
+  }
+
+  function parseEndpoint(value, index, field) {
+    const match = typeof value === "string" && value.match(/^([^#\s]+)#([^#\s]+)$/);
+    if (!match) {
+      throw new Error(`Relay rule ${index}: ${field} must look like "team#channel-name", got ${JSON.stringify(value)}`);
+    }
+    const team = teamAliases[match[1].toLowerCase()] || match[1];
+    if (!/^[TE][A-Z0-9]+$/.test(team)) {
+      throw new Error(`Relay rule ${index}: unknown team "${match[1]}" in ${field}`);
+    }
+    return { team, channel: match[2] };
+  }
+
+  const rules = [];
+  const seen = new Set();
+  entries.forEach((entry, index) => {
+    if (!entry || typeof entry !== "object") {
+      throw new Error(`Relay rule ${index}: expected an object`);
+    }
+    const source = parseEndpoint(entry.source, index, "source");
+    const target = parseEndpoint(entry.target, index, "target");
+    if (source.team === target.team && source.channel === target.channel) {
+      throw new Error(`Relay rule ${index}: source and target are the same channel`);
+    }
+    if (entry.bidirectional !== undefined && typeof entry.bidirectional !== "boolean") {
+      throw new Error(`Relay rule ${index}: bidirectional must be true or false`);
+    }
+    const directions = entry.bidirectional === false ? [[source, target]] : [[source, target], [target, source]];
+    for (const [from, to] of directions) {
+      const key = `${from.team}#${from.channel}>${to.team}#${to.channel}`;
+      if (seen.has(key)) {
+        throw new Error(`Relay rule ${index}: ${from.team}#${from.channel} -> ${to.team}#${to.channel} is listed twice`);
+      }
+      seen.add(key);
+      rules.push({
+        sourceTeam: from.team,
+        sourceChannelName: from.channel,
+        targetTeam: to.team,
+        targetChannelName: to.channel,
+        sourceChannelId: null,
+        targetChannelId: null,
+      });
+    }
+  });
+  return rules;
+}
+
+function createRelay({
+  rules,
+  getClientForTeam,
+  createClient,
+  resolveChannelId,
+  getUserInfo,
+  tsMapFile = null,
+  tsMapTtlSeconds = RELAY_TS_MAP_TTL_SECONDS,
+  tsMapMaxEntries = RELAY_TS_MAP_MAX_ENTRIES,
+  tsMapCompactMinLines = RELAY_TS_MAP_COMPACT_MIN_LINES,
+  flushMs = RELAY_TS_MAP_FLUSH_MS,
+  slowPostWarnMs = RELAY_SLOW_POST_WARN_MS,
+  batchMaxMessages = RELAY_BATCH_MAX_MESSAGES,
+  batchMaxChars = RELAY_BATCH_MAX_CHARS,
+  postsPerSecond = RELAY_POSTS_PER_SECOND,
+  postBurst = RELAY_POST_BURST,
+  now = () => Date.now() / 1000,
+  logger = console,
+}) {
+  // Ts map is kept in least-recently-touched order so eviction only has to walk the front
+  const tsMap = new Map();
+  const queues = new Map();
+  const userCache = {};
+  const relayClients = {};
+  const tokenOwners = {};
+  const rateLimitedUntil = {};
+  const postBuckets = {};
+  let flushTimer = null;
+  let flushChain = Promise.resolve();
+  let pendingLines = [];
+  let loggedLines = 0;
+
+  function getRelayClient(teamId) {
+    const base = getClientForTeam(teamId);
+    const cached = relayClients[teamId];
+    if (cached && cached.token === base.token) return cached.client;
+    const client = createClient(base.token);
+    relayClients[teamId] = { token: base.token, client };
+    return client;
+  }
+
+  function getTokenOwner(teamId) {
+    // The user behind the posting token; looked up once via auth.test
+    if (!tokenOwners[teamId]) {
+      tokenOwners[teamId] = Promise.resolve()
+        .then(() => getRelayClient(teamId).auth.test())
+        .then(
+          (result) => result.user_id,
+          (err) => {
+            delete tokenOwners[teamId];
+            logger.error(`Relay auth.test failed for ${teamId}:`, err.data?.error || err.message || err);
+            return null;
+          }
+        );
+    }
+    return tokenOwners[teamId];
+  }
+
+  async function ensureRuleChannels(rule) {
+    if (!rule.sourceChannelId) {
+      const sourceClient = getRelayClient(rule.sourceTeam);
+      rule.sourceChannelId = await resolveChannelId(sourceClient, rule.sourceTeam, rule.sourceChannelName);
+    }
+    if (!rule.targetChannelId) {
+      const targetClient = getRelayClient(rule.targetTeam);
+      rule.targetChannelId = await resolveChannelId(targetClient, rule.targetTeam, rule.targetChannelName);
+    }
+  }
+
+  async function prime() {
+    const results = await Promise.allSettled(
+      rules.map(async (rule) => {
+        await ensureRuleChannels(rule);
+        await getTokenOwner(rule.targetTeam);
+      })
+    );
+    results.forEach((result, index) => {
+      if (result.status === "rejected") {
+        const rule = rules[index];
+        logger.warn(
+          `Relay rule ${rule.sourceTeam}#${rule.sourceChannelName} -> ${rule.targetTeam}#${rule.targetChannelName} not ready:`,
+          result.reason?.message || result.reason
+        );
+      }
+    });
+  }
+
+  async function compactTsMap() {
+    // Rewrite the log from the live map in chunks, yielding between writes, then swap it in
+    const tmpFile = `${tsMapFile}.tmp`;
+    const handle = await fs.promises.open(tmpFile, "w");
+    let written = 0;
+    try {
+      let chunk = [];
+      for (const [key, entry] of tsMap) {
+        chunk.push(JSON.stringify([key, entry]));
+        if (chunk.length >= RELAY_TS_MAP_COMPACT_CHUNK) {
+          await handle.write(`${chunk.join("\n")}\n`);
+          written += chunk.length;
+          chunk = [];
+        }
+      }
+      if (chunk.length) {
+        await handle.write(`${chunk.join("\n")}\n`);
+        written += chunk.length;
+      }
+    } finally {
+      await handle.close();
+    }
+    await fs.promises.rename(tmpFile, tsMapFile);
+    loggedLines = written;
+  }
+
+  function flushTsMap() {
+    if (!tsMapFile) return Promise.resolve();
+    // Only changed entries are appended; the full rewrite happens once the log is mostly stale lines
+    flushChain = flushChain
+      .then(async () => {
+        if (pendingLines.length) {
+          const lines = pendingLines;
+          pendingLines = [];
+          await fs.promises.appendFile(tsMapFile, `${lines.join("\n")}\n`, "utf8");
+          loggedLines += lines.length;
+        }
+        if (loggedLines > Math.max(tsMapCompactMinLines, 2 * tsMap.size)) await compactTsMap();
+      })
+      .catch((err) => logger.error("Failed to persist relay ts map:", err.message || err));
+    return flushChain;
+  }
+
+  function scheduleFlush() {
+    if (!tsMapFile || flushTimer) return;
+    flushTimer = setTimeout(() => {
+      flushTimer = null;
+      flushTsMap();
+    }, flushMs);
+    flushTimer.unref?.();
+  }
+
+  function recordEntry(key) {
+    if (!tsMapFile) return;
+    const entry = tsMap.get(key);
+    if (!entry) return;
+    pendingLines.push(JSON.stringify([key, entry]));
+    scheduleFlush();
+  }
+
+  function evictStale() {
+    const cutoff = now() - tsMapTtlSeconds;
+    for (const [key, entry] of tsMap) {
+      if (entry.touchedAt >= cutoff && tsMap.size <= tsMapMaxEntries) break;
+      tsMap.delete(key);
+    }
+  }
+
+  function touch(key) {
+    const entry = tsMap.get(key);
+    if (!entry) return undefined;
+    entry.touchedAt = now();
+    tsMap.delete(key);
+    tsMap.set(key, entry);
+    recordEntry(key);
+    return entry;
+  }
+
+  function loadTsMap() {
+    if (!tsMapFile || !fs.existsSync(tsMapFile)) return;
+    try {
+      const lines = fs.readFileSync(tsMapFile, "utf8").split("\n");
+      const loadedAt = now();
+      for (const line of lines) {
+        if (!line) continue;
+        loggedLines += 1;
+        let parsed;
+        try {
+          parsed = JSON.parse(line);
+        } catch {
+          // A crash mid-append leaves at most one torn line at the end
+          continue;
+        }
+        const [key, entry] = Array.isArray(parsed) ? parsed : [];
+        if (typeof key !== "string" || !entry || typeof entry !== "object" || !entry.peers) continue;
+        if (typeof entry.touchedAt !== "number") entry.touchedAt = loadedAt;
+        tsMap.delete(key);
+        tsMap.set(key, entry);
+      }
+      evictStale();
+      if (tsMap.size) {
+        logger.log(`Loaded ${tsMap.size} relay ts mapping(s) from disk`);
+      }
+    } catch (err) {
+      logger.error("Failed to load relay ts map:", err.message || err);
+    }
+  }
+
+  function rememberRelayed(source, target) {
+    // Both sides point at each other so replies in either workspace land in the paired thread
+    const sourceKey = relayKey(source.team, source.channel, source.ts);
+    const targetKey = relayKey(target.team, target.channel, target.ts);
+    const sourceEntry = tsMap.get(sourceKey) || { relayed: false, peers: {} };
+    sourceEntry.peers[`${target.team}:${target.channel}`] = target.ts;
+    tsMap.set(sourceKey, sourceEntry);
+    touch(sourceKey);
+    // A batched post maps back to the first message it carries
+    if (!tsMap.has(targetKey)) {
+      tsMap.set(targetKey, {
+        relayed: true,
+        peers: { [`${source.team}:${source.channel}`]: source.ts },
+        touchedAt: now(),
+      });
+    }
+    touch(targetKey);
+    evictStale();
+  }
+
+  function lookupPeerTs(teamId, channelId, ts, peerChannelKey) {
+    // An active thread keeps both halves of its mapping alive
+    const peerTs = touch(relayKey(teamId, channelId, ts))?.peers[peerChannelKey];
+    if (peerTs) touch(`${peerChannelKey}:${peerTs}`);
+    return peerTs;
+  }
+
+  async function isRelayEcho(teamId, event) {
+    if (tsMap.get(relayKey(teamId, event.channel, event.ts))?.relayed) return true;
+    // Covers the window before chat.postMessage resolves: our prefix, posted by our own token owner
+    const text = event.text || "";
+    const prefixed = rules.some(
+      (rule) =>
+        rule.targetTeam === teamId &&
+        rule.targetChannelId === event.channel &&
+        text.startsWith(`[${rule.sourceChannelName}] `)
+    );
+    if (!prefixed || !event.user) return false;
+    return event.user === (await getTokenOwner(teamId));
+  }
+
+  async function getUserName(teamId, userId) {
+    if (!userId) return "Slack App";
+    const cacheKey = `${teamId}:${userId}`;
+    const cached = userCache[cacheKey];
+    if (cached?.name && now() < cached.expiresAt) return cached.name;
+    if (cached?.pending) return cached.pending;
+    // Concurrent messages from the same author share a single users.info call
+    const pending = Promise.resolve()
+      .then(() => getUserInfo(getRelayClient(teamId), userId))
+      .catch(() => ({}))
+      .then((info) => {
+        const name = info.name || info.display_name;
+        const ttl = name ? RELAY_USER_CACHE_TTL_SECONDS : RELAY_USER_MISS_TTL_SECONDS;
+        userCache[cacheKey] = { name: name || userId, expiresAt: now() + ttl };
+        return name || userId;
+      });
+    userCache[cacheKey] = { ...cached, pending };
+    return pending;
+  }
+
+  function warnIfSlow(promise, label) {
+    const timer = setTimeout(
+      () => logger.warn(`${label} still pending after ${slowPostWarnMs}ms; holding the channel to keep order`),
+      slowPostWarnMs
+    );
+    timer.unref?.();
+    return promise.finally(() => clearTimeout(timer));
+  }
+
+  function threadKey(event) {
+    return event.thread_ts && event.thread_ts !== event.ts ? event.thread_ts : "";
+  }
+
+  function takeNextGroup(items) {
+    // The oldest pending message picks the destination (top level or one thread), which keeps order and
+    // posts a parent before its replies; everything else waiting for that destination rides along
+    const key = threadKey(items[0].event);
+    const group = [];
+    let chars = 0;
+    for (const item of items) {
+      if (threadKey(item.event) !== key) continue;
+      const size = messageBody(item.event).length + RELAY_LINE_OVERHEAD_CHARS;
+      const broadcast = item.event.subtype === "thread_broadcast" || group[0]?.event.subtype === "thread_broadcast";
+      const full = group.length >= batchMaxMessages || chars + size > batchMaxChars;
+      if (group.length && (broadcast || full)) break;
+      group.push(item);
+      chars += size;
+    }
+    return group;
+  }
+
+  async function relayGroup(rule, teamId, group) {
+    const started = Date.now();
+    const first = group[0].event;
+    const channel = first.channel;
+    const targetClient = getRelayClient(rule.targetTeam);
+    const targetChannelKey = `${rule.targetTeam}:${rule.targetChannelId}`;
+
+    let threadTs;
+    let orphaned = false;
+    if (threadKey(first)) {
+      threadTs = lookupPeerTs(teamId, channel, first.thread_ts, targetChannelKey);
+      if (!threadTs) {
+        orphaned = true;
+        logger.warn(
+          `Relay has no mapping for thread ${first.thread_ts} in ${teamId}:${channel}; posting labelled top-level`
+        );
+      }
+    }
+
+    const lines = [];
+    for (const { event, userName } of group) {
+      const name = await userName;
+      const label = orphaned ? `${name} (reply in an earlier thread)` : name;
+      lines.push(`[${rule.sourceChannelName}] ${label}: ${messageBody(event)}`);
+    }
+    let text = lines.join("\n");
+    // Only a single oversized message can get here; batches are already capped by batchMaxChars
+    if (text.length > RELAY_POST_MAX_CHARS) text = `${text.slice(0, RELAY_POST_MAX_CHARS - 1)}…`;
+    const resp = await targetClient.chat.postMessage({
+      channel: rule.targetChannelId,
+      text,
+      thread_ts: threadTs,
+      reply_broadcast: threadTs && first.subtype === "thread_broadcast" ? true : undefined,
+    });
+
+    for (const { event } of group) {
+      rememberRelayed(
+        { team: teamId, channel, ts: event.ts },
+        { team: rule.targetTeam, channel: rule.targetChannelId, ts: resp.ts }
+      );
+    }
+
+    const sinceReceived = Date.now() - group[0].receivedAt;
+    logger.log(
+      `[${logTime()}] Relayed ${group.length} message(s) from ${rule.sourceTeam}#${rule.sourceChannelName} to ${rule.targetTeam}#${rule.targetChannelName} ts=${resp.ts}${threadTs ? ` thread=${threadTs}` : ""} (${Date.now() - started}ms, ${sinceReceived}ms since received)`
+    );
+  }
+
+  function postSlotWaitMs(targetChannelKey) {
+    // Token bucket per target channel, mirroring Slack's ~1 post/s per channel with short bursts
+    const nowMs = Date.now();
+    const bucket = postBuckets[targetChannelKey] || { tokens: postBurst, updatedAt: nowMs };
+    bucket.tokens = Math.min(postBurst, bucket.tokens + ((nowMs - bucket.updatedAt) / 1000) * postsPerSecond);
+    bucket.updatedAt = nowMs;
+    postBuckets[targetChannelKey] = bucket;
+    const pacingMs = bucket.tokens >= 1 ? 0 : ((1 - bucket.tokens) / postsPerSecond) * 1000;
+    return Math.max(pacingMs, (rateLimitedUntil[targetChannelKey] || 0) - nowMs, 0);
+  }
+
+  async function waitForPostSlots(targetChannelKeys) {
+    for (;;) {
+      const wait = Math.max(0, ...targetChannelKeys.map(postSlotWaitMs));
+      if (!wait) return;
+      await new Promise((resolve) => setTimeout(resolve, wait));
+    }
+  }
+
+  async function postGroup(rule, teamId, group) {
+    const targetChannelKey = `${rule.targetTeam}:${rule.targetChannelId}`;
+    postSlotWaitMs(targetChannelKey);
+    postBuckets[targetChannelKey].tokens -= 1;
+    try {
+      // The channel waits for each post to settle so a slow one can never land after later messages;
+      // the relay clients' own timeout and retry budget is what bounds that wait
+      await warnIfSlow(relayGroup(rule, teamId, group), `Relay of ${group[0].event.ts}`);
+    } catch (err) {
+      if (err.code === RATE_LIMITED_ERROR_CODE) {
+        // Leave the group at the head of the queue; it goes out once retry-after has passed
+        const retryAfterMs = (err.retryAfter || 1) * 1000;
+        rateLimitedUntil[targetChannelKey] = Math.max(rateLimitedUntil[targetChannelKey] || 0, Date.now() + retryAfterMs);
+        logger.warn(
+          `Relay to ${rule.targetTeam}#${rule.targetChannelName} rate limited; holding ${group.length} message(s) for ${retryAfterMs}ms`
+        );
+        for (const item of group) {
+          item.rateLimitedAttempts = (item.rateLimitedAttempts || 0) + 1;
+          if (item.rateLimitedAttempts >= RELAY_RATE_LIMIT_MAX_ATTEMPTS) {
+            logger.error(`Dropping relay of ${item.event.ts} after ${item.rateLimitedAttempts} rate-limited attempts`);
+            item.doneRules.add(rule);
+          }
+        }
+        return;
+      }
+      logger.error(
+        `Failed to forward message from ${rule.sourceTeam}#${rule.sourceChannelName}:`,
+        err.data?.error || err.message || err
+      );
+    }
+    for (const item of group) item.doneRules.add(rule);
+  }
+
+  async function dropEchoes(teamId, queue) {
+    await Promise.all(
+      queue.items.map(async (item) => {
+        if (item.echo !== undefined) return;
+        try {
+          item.echo = await isRelayEcho(teamId, item.event);
+        } catch (err) {
+          logger.error(`Relay echo check failed for ${item.event.ts}:`, err.message || err);
+          item.echo = true;
+        }
+      })
+    );
+    const echoes = queue.items.filter((item) => item.echo);
+    if (!echoes.length) return;
+    queue.items = queue.items.filter((item) => !item.echo);
+    for (const item of echoes) item.done();
+  }
+
+  async function activeRulesFor(teamId, channel) {
+    const active = [];
+    for (const rule of rules) {
+      if (rule.sourceTeam !== teamId) continue;
+      try {
+        await ensureRuleChannels(rule);
+      } catch (err) {
+        logger.error(`Relay rule ${rule.sourceTeam}#${rule.sourceChannelName} not ready:`, err.message || err);
+        continue;
+      }
+      if (channel === rule.sourceChannelId) active.push(rule);
+    }
+    return active;
+  }
+
+  async function drain(queueKey, teamId) {
+    // One drain loop per source channel; each turn posts one destination's worth of pending messages
+    const queue = queues.get(queueKey);
+    if (queue.draining) return;
+    queue.draining = true;
+    try {
+      while (queue.items.length) {
+        const activeRules = await activeRulesFor(teamId, queue.items[0].event.channel);
+        if (!activeRules.length) {
+          const skipped = queue.items;
+          queue.items = [];
+          for (const item of skipped) item.done();
+          break;
+        }
+        // Wait for a post slot before picking the group, so whatever arrives meanwhile joins it
+        await waitForPostSlots(activeRules.map((rule) => `${rule.targetTeam}:${rule.targetChannelId}`));
+        await dropEchoes(teamId, queue);
+        // Messages that arrived during the echo check are checked on the next turn
+        const checked = queue.items.filter((item) => item.echo === false);
+        if (!checked.length) continue;
+        const group = takeNextGroup(checked);
+        for (const rule of activeRules) {
+          const owed = group.filter((item) => !item.doneRules.has(rule));
+          if (owed.length) await postGroup(rule, teamId, owed);
+        }
+        const finished = group.filter((item) => activeRules.every((rule) => item.doneRules.has(rule)));
+        queue.items = queue.items.filter((item) => !finished.includes(item));
+        for (const item of finished) item.done();
+      }
+    } finally {
+      queue.draining = false;
+      if (!queue.items.length) queues.delete(queueKey);
+    }
+  }
+
+  function handleMessage(teamId, event) {
+    if (event.type !== "message" || event.bot_id) return Promise.resolve();
+    if (!RELAYABLE_SUBTYPES.has(event.subtype)) return Promise.resolve();
+    // A rule whose channel is not resolved yet could still match; queue so the drain can resolve it
+    const covered = rules.some(
+      (rule) => rule.sourceTeam === teamId && (!rule.sourceChannelId || rule.sourceChannelId === event.channel)
+    );
+    if (!covered) return Promise.resolve();
+    const queueKey = `${teamId}:${event.channel}`;
+    if (!queues.has(queueKey)) queues.set(queueKey, { items: [], draining: false });
+    return new Promise((resolve) => {
+      // Start the author lookup now so it overlaps with whatever is ahead in the queue
+      const userName = getUserName(teamId, event.user);
+      queues.get(queueKey).items.push({
+        event,
+        userName,
+        receivedAt: Date.now(),
+        doneRules: new Set(),
+        done: resolve,
+      });
+      drain(queueKey, teamId);
+    });
+  }
+
+  loadTsMap();
+
+  return { handleMessage, prime, getUserName, flushTsMap, tsMap };
+}
+
+module.exports = { createRelay, loadRelayRules, relayKey, RELAYABLE_SUBTYPES };
@@ -0,0 +1,127 @@
+// Measures relay latency (event received -> chat.postMessage resolved) against fake Slack clients.
+// The fake chat.postMessage enforces Slack's per-channel limit (about 1 post/s with short bursts) and
+// answers with a rate-limited error carrying retryAfter, like WebClient with rejectRateLimitedCalls.
+// Usage: RATE=600 DURATION_SECONDS=60 SLACK_LATENCY_MS=200 node scripts/relay-bench.js
+const { createRelay } = require("../relay");
+
+const RATE = Number(process.env.RATE || 600); // messages per minute
+const DURATION_SECONDS = Number(process.env.DURATION_SECONDS || 30);
+const SLACK_LATENCY_MS = Number(process.env.SLACK_LATENCY_MS || 200); // mean; jitter is +/-50%
+const CHANNELS = Number(process.env.CHANNELS || 1);
+const USERS = Number(process.env.USERS || 25);
+const THREAD_RATIO = Number(process.env.THREAD_RATIO || 0.3);
+const ACTIVE_THREADS = Number(process.env.ACTIVE_THREADS || 5); // replies pick among the latest N parents
+const POSTS_PER_SECOND = Number(process.env.POSTS_PER_SECOND || 1); // per target channel
+const POST_BURST = Number(process.env.POST_BURST || 3);
+
+const stats = { posts: 0, rateLimited: 0, dropped: 0 };
+
+function slackDelay() {
+  const ms = SLACK_LATENCY_MS * (0.5 + Math.random());
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+function takePostToken(buckets, channel) {
+  // Token bucket per channel: POST_BURST capacity, refilled at POSTS_PER_SECOND
+  const nowMs = Date.now();
+  const bucket = buckets[channel] || { tokens: POST_BURST, updatedAt: nowMs };
+  bucket.tokens = Math.min(POST_BURST, bucket.tokens + ((nowMs - bucket.updatedAt) / 1000) * POSTS_PER_SECOND);
+  bucket.updatedAt = nowMs;
+  buckets[channel] = bucket;
+  if (bucket.tokens < 1) return Math.ceil((1 - bucket.tokens) / POSTS_PER_SECOND);
+  bucket.tokens -= 1;
+  return 0;
+}
+
+function fakeClient(teamId) {
+  let seq = 1;
+  const buckets = {};
+  return {
+    token: `token-${teamId}`,
+    auth: { test: async () => ({ user_id: `U${teamId}BOT` }) },
+    chat: {
+      postMessage: async ({ channel }) => {
+        await slackDelay();
+        const retryAfter = takePostToken(buckets, channel);
+        if (retryAfter) {
+          stats.rateLimited += 1;
+          throw Object.assign(new Error("rate limited"), { code: "slack_webapi_rate_limited_error", retryAfter });
+        }
+        stats.posts += 1;
+        return { ts: `${Math.floor(Date.now() / 1000)}.${String(seq++).padStart(6, "0")}` };
+      },
+    },
+  };
+}
+
+const clients = { TSRC: fakeClient("TSRC"), TDST: fakeClient("TDST") };
+const rules = [];
+for (let c = 0; c < CHANNELS; c += 1) {
+  rules.push({
+    sourceTeam: "TSRC",
+    sourceChannelName: `src-${c}`,
+    targetTeam: "TDST",
+    targetChannelName: `dst-${c}`,
+    sourceChannelId: `CSRC${c}`,
+    targetChannelId: `CDST${c}`,
+  });
+}
+
+const relay = createRelay({
+  rules,
+  getClientForTeam: (teamId) => clients[teamId],
+  createClient: (token) => Object.values(clients).find((client) => client.token === token),
+  resolveChannelId: async () => {
+    throw new Error("bench rules are pre-resolved");
+  },
+  getUserInfo: async (client, userId) => {
+    await slackDelay();
+    return { id: userId, name: `User ${userId}` };
+  },
+  logger: {
+    log() {},
+    warn() {},
+    error: (first, ...rest) => {
+      if (String(first).startsWith("Dropping relay")) stats.dropped += 1;
+      else console.error(first, ...rest);
+    },
+  },
+});
+
+function percentile(sorted, p) {
+  return sorted[Math.min(sorted.length - 1, Math.floor((p / 100) * sorted.length))];
+}
+
+async function main() {
+  const total = Math.round((RATE / 60) * DURATION_SECONDS);
+  const intervalMs = 60000 / RATE;
+  const latencies = [];
+  const parents = [];
+  const pending = [];
+  const start = Date.now();
+
+  for (let i = 0; i < total; i += 1) {
+    const due = start + i * intervalMs;
+    const wait = due - Date.now();
+    if (wait > 0) await new Promise((resolve) => setTimeout(resolve, wait));
+    const channel = `CSRC${i % CHANNELS}`;
+    const ts = (1_700_000_000 + i / 1000).toFixed(6);
+    const event = { type: "message", channel, user: `U${i % USERS}`, ts, text: `message ${i}` };
+    const recent = parents.slice(-ACTIVE_THREADS);
+    const parent = recent.length && Math.random() < THREAD_RATIO ? recent[Math.floor(Math.random() * recent.length)] : null;
+    if (parent && parent.channel === channel) event.thread_ts = parent.ts;
+    else parents.push({ channel, ts });
+    const received = Date.now();
+    pending.push(relay.handleMessage("TSRC", event).then(() => latencies.push(Date.now() - received)));
+  }
+  await Promise.all(pending);
+
+  latencies.sort((a, b) => a - b);
+  console.log(
+    `rate=${RATE}/min channels=${CHANNELS} thread_ratio=${THREAD_RATIO} active_threads=${ACTIVE_THREADS} slack_latency~${SLACK_LATENCY_MS}ms limit=${POSTS_PER_SECOND}/s burst=${POST_BURST} ` +
+      `messages=${latencies.length} posts=${stats.posts} rate_limited=${stats.rateLimited} dropped=${stats.dropped} ` +
+      `p50=${percentile(latencies, 50)}ms p95=${percentile(latencies, 95)}ms p99=${percentile(latencies, 99)}ms max=${latencies[latencies.length - 1]}ms`
+  );
+}
+
+main();
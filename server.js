@@ -7,6 +7,7 @@ const cors = require("cors");
 const dotenv = require("dotenv");
 const { WebClient } = require("@slack/web-api");
 const swaggerUi = require("swagger-ui-express");
+const { createRelay, loadRelayRules } = require("./relay");
 
 // Load environment variables from .env if present
 const ENV_PATH = path.join(__dirname, ".env");
@@ -32,6 +33,7 @@ const SLACK_BOT_TOKEN_BETA = requireEnv("SLACK_BOT_TOKEN_BETA");
 const TEAM_BETA = requireEnv("TEAM_BETA");
 
 const LOG_HISTORY = (process.env.LOG_HISTORY || "false").toLowerCase() === "true";
+const LOG_EVENT_DETAILS = (process.env.LOG_EVENT_DETAILS || "false").toLowerCase() === "true";
 const HISTORY_LOOKBACK_SECONDS = 12 * 60 * 60;
 const EVENT_TTL_SECONDS = 300;
 const PROCESSED_EVENTS = new Map();
@@ -69,26 +71,32 @@ const workspaceTokens = {};
 const workspaceClients = {};
 const TOKENS_FILE = path.join(__dirname, "workspaceTokens.json");
 const CHANNEL_NAME_CACHE = {};
+const CHANNEL_LIST_INFLIGHT = {};
 
-// Forward messages from Strateger AI (#test-channel) into RTC (#test-client)
-const FORWARD_RULES = [
-  {
-    sourceTeam: "T08EPASQ09H", // Strateger AI team_id
-    sourceChannelName: "test-channel",
-    targetTeam: TEAM_RTC,
-    targetChannelName: "test-client",
-    sourceChannelId: null,
-    targetChannelId: null,
-  },
-  {
-    sourceTeam: TEAM_RTC,
-    sourceChannelName: "test-client",
-    targetTeam: "T08EPASQ09H", // Strateger AI team_id
-    targetChannelName: "test-channel",
-    sourceChannelId: null,
-    targetChannelId: null,
-  },
-];
+// Relay rules: RELAY_RULES (inline JSON) or RELAY_RULES_FILE (default relayRules.json), validated at startup.
+// Without either, #test-client in RTC is paired with #test-channel in Beta.
+const RELAY_RULES_FILE = process.env.RELAY_RULES_FILE || path.join(__dirname, "relayRules.json");
+const DEFAULT_RELAY_RULES = JSON.stringify([{ source: "rtc#test-client", target: "beta#test-channel", bidirectional: true }]);
+
+function readRelayRulesConfig() {
+  if (process.env.RELAY_RULES) return process.env.RELAY_RULES;
+  if (fs.existsSync(RELAY_RULES_FILE)) return fs.readFileSync(RELAY_RULES_FILE, "utf8");
+  if (process.env.RELAY_RULES_FILE) {
+    throw new Error(`Relay rules file ${RELAY_RULES_FILE} not found`);
+  }
+  return DEFAULT_RELAY_RULES;
+}
+
+const FORWARD_RULES = loadRelayRules(readRelayRulesConfig(), { rtc: TEAM_RTC, beta: TEAM_BETA });
+
+const RELAY_TS_MAP_FILE = path.join(__dirname, "relayTsMap.jsonl");
+// Relay calls fail fast instead of sitting in the default 30-minute retry/rate-limit backoff.
+// Worst case per call is 2 x 2000ms + 200ms backoff, inside the relay's 5s slow-post warning.
+const RELAY_CLIENT_OPTIONS = {
+  timeout: 2000,
+  rejectRateLimitedCalls: true,
+  retryConfig: { retries: 1, factor: 1, minTimeout: 200, maxTimeout: 200 },
+};
 
 const swaggerDocument = {
   openapi: "3.0.0",
@@ -374,14 +382,29 @@ function getCachedChannelId(teamId, channelName) {
   return CHANNEL_NAME_CACHE[teamId]?.[channelName];
 }
 
+async function loadChannelNames(client, teamId) {
+  // Share one conversations.list sweep between concurrent lookups and cache every name it returns
+  if (!CHANNEL_LIST_INFLIGHT[teamId]) {
+    CHANNEL_LIST_INFLIGHT[teamId] = fetchConversations(client, "public_channel,private_channel")
+      .then((channels) => {
+        for (const channel of channels) {
+          if (channel.name) cacheChannelId(teamId, channel.name, channel.id);
+        }
+      })
+      .finally(() => {
+        delete CHANNEL_LIST_INFLIGHT[teamId];
+      });
+  }
+  return CHANNEL_LIST_INFLIGHT[teamId];
+}
+
 async function resolveChannelIdByName(client, teamId, channelName) {
   const cached = getCachedChannelId(teamId, channelName);
   if (cached) return cached;
-  const channels = await fetchConversations(client, "public_channel,private_channel");
-  const match = channels.find((c) => c.name === channelName);
-  if (!match) throw httpError(404, `Channel ${channelName} not found in team ${teamId}`);
-  cacheChannelId(teamId, channelName, match.id);
-  return match.id;
+  await loadChannelNames(client, teamId);
+  const channelId = getCachedChannelId(teamId, channelName);
+  if (!channelId) throw httpError(404, `Channel ${channelName} not found in team ${teamId}`);
+  return channelId;
 }
 
 function getClientForOrg(orgId) {
@@ -714,9 +737,15 @@ async function logMessageEvent(teamId, client, event, eventId = "") {
   const ts = event.ts;
   const msgTime = tsToDatetime(ts);
   try {
-    console.log(`[${msgTime}] [IN ${teamId}] user=${user} channel=${channel} text=${text} event_id=${eventId}`);
-    await printUserInfo(client, user, teamId);
-    await printChannelInfo(client, channel, teamId);
+    // Shares the relay's user cache so logging does not burn users.info rate limit per message
+    const userName = await relay.getUserName(teamId, user);
+    console.log(
+      `[${msgTime}] [IN ${teamId}] user=${user} (${userName}) channel=${channel} text=${text} event_id=${eventId}`
+    );
+    if (LOG_EVENT_DETAILS) {
+      await printUserInfo(client, user, teamId);
+      await printChannelInfo(client, channel, teamId);
+    }
     if (LOG_HISTORY) {
       await printMessageHistory(client, channel, teamId, 10);
     }
@@ -725,45 +754,14 @@ async function logMessageEvent(teamId, client, event, eventId = "") {
   }
 }
 
-async function ensureForwardRuleChannels(rule) {
-  if (!rule.sourceChannelId) {
-    const sourceClient = getClientForTeam(rule.sourceTeam);
-    rule.sourceChannelId = await resolveChannelIdByName(sourceClient, rule.sourceTeam, rule.sourceChannelName);
-  }
-  if (!rule.targetChannelId) {
-    const targetClient = getClientForTeam(rule.targetTeam);
-    rule.targetChannelId = await resolveChannelIdByName(targetClient, rule.targetTeam, rule.targetChannelName);
-  }
-}
-
-async function maybeForwardMessage(teamId, client, event) {
-  if (event.type !== "message" || event.bot_id) return;
-  for (const rule of FORWARD_RULES) {
-    if (rule.sourceTeam !== teamId) continue;
-    try {
-      await ensureForwardRuleChannels(rule);
-      if (rule.sourceChannelId && event.channel === rule.sourceChannelId) {
-        const targetClient = getClientForTeam(rule.targetTeam);
-        const userLabel = await getUserLabel(client, event.user, {});
-        const text = event.text || "";
-        const outbound = `[${rule.sourceChannelName}] ${userLabel.name || event.user}: ${text}`;
-        await targetClient.chat.postMessage({
-          channel: rule.targetChannelId,
-          text: outbound,
-        });
-        const now = new Date().toISOString().replace("T", " ").split(".")[0];
-        console.log(
-          `[${now}] Forwarded message ${event.ts} from ${rule.sourceTeam}#${rule.sourceChannelName} to ${rule.targetTeam}#${rule.targetChannelName}`
-        );
-      }
-    } catch (err) {
-      console.error(
-        `Failed to forward message from ${rule.sourceTeam}#${rule.sourceChannelName}:`,
-        err.message || err
-      );
-    }
-  }
-}
+const relay = createRelay({
+  rules: FORWARD_RULES,
+  getClientForTeam,
+  createClient: (token) => new WebClient(token, RELAY_CLIENT_OPTIONS),
+  resolveChannelId: resolveChannelIdByName,
+  getUserInfo,
+  tsMapFile: RELAY_TS_MAP_FILE,
+});
 
 // Routes
 app.get("/api/organizations", async (req, res, next) => {
@@ -850,7 +848,7 @@ app.post("/slack/events", async (req, res, next) => {
 
     if (event.type === "message" && !event.bot_id) {
       setImmediate(() => logMessageEvent(teamId, clientForTeam, event, eventId));
-      setImmediate(() => maybeForwardMessage(teamId, clientForTeam, event));
+      setImmediate(() => relay.handleMessage(teamId, event));
     }
 
     res.json({ ok: true });
@@ -1010,4 +1008,5 @@ app.use((err, req, res, next) => {
 
 app.listen(PORT, () => {
   console.log(`Node Slack backend listening on port ${PORT}`);
+  relay.prime();
 });
@@ -0,0 +1,403 @@
+const test = require("node:test");
+const assert = require("node:assert/strict");
+const fs = require("fs");
+const os = require("os");
+const path = require("path");
+const { createRelay, loadRelayRules, relayKey } = require("../relay");
+
+const SOURCE = "TSRC";
+const TARGET = "TDST";
+const OWNERS = { [SOURCE]: "USRCBOT", [TARGET]: "UDSTBOT" };
+
+function makeRules() {
+  return [
+    {
+      sourceTeam: SOURCE,
+      sourceChannelName: "test-channel",
+      targetTeam: TARGET,
+      targetChannelName: "test-client",
+      sourceChannelId: "CSRC",
+      targetChannelId: "CDST",
+    },
+    {
+      sourceTeam: TARGET,
+      sourceChannelName: "test-client",
+      targetTeam: SOURCE,
+      targetChannelName: "test-channel",
+      sourceChannelId: "CDST",
+      targetChannelId: "CSRC",
+    },
+  ];
+}
+
+function makeHarness(overrides = {}) {
+  const posts = [];
+  const calls = { users: 0, auth: 0 };
+  let seq = 1;
+  const clock = { now: 1_700_000_000 };
+  const postDelay = overrides.postDelay || (() => 0);
+  const postError = overrides.postError || (() => null);
+  const fakeClient = (teamId) => ({
+    token: `token-${teamId}`,
+    auth: {
+      test: async () => {
+        calls.auth += 1;
+        return { user_id: OWNERS[teamId] };
+      },
+    },
+    chat: {
+      postMessage: async (args) => {
+        await new Promise((resolve) => setTimeout(resolve, postDelay(args)));
+        const err = postError(args);
+        if (err) throw err;
+        const ts = `${2000 + seq++}.000100`;
+        posts.push({ teamId, ...args, ts });
+        return { ts };
+      },
+    },
+  });
+  const clients = { [SOURCE]: fakeClient(SOURCE), [TARGET]: fakeClient(TARGET) };
+  const logger = { log() {}, warn() {}, error() {} };
+  const relay = createRelay({
+    rules: makeRules(),
+    getClientForTeam: (teamId) => {
+      if (!clients[teamId]) throw new Error(`Unknown team_id ${teamId}`);
+      return clients[teamId];
+    },
+    createClient: (token) => Object.values(clients).find((c) => c.token === token),
+    resolveChannelId: async () => {
+      throw new Error("rules are pre-resolved in tests");
+    },
+    getUserInfo:
+      overrides.getUserInfo ||
+      (async (client, userId) => {
+        calls.users += 1;
+        return { id: userId, name: `Name-${userId}` };
+      }),
+    now: () => clock.now,
+    logger,
+    postsPerSecond: 1000,
+    postBurst: 1000,
+    ...overrides.relayOptions,
+  });
+  return { relay, posts, calls, clock };
+}
+
+function message(channel, ts, text, extra = {}) {
+  return { type: "message", channel, user: "UHUMAN", ts, text, ...extra };
+}
+
+test("relays in order and batches messages that queue up behind a post", async () => {
+  const { relay, posts, calls } = makeHarness({ postDelay: () => Math.random() * 10 });
+  const pending = [];
+  for (let i = 0; i < 30; i += 1) {
+    pending.push(relay.handleMessage(SOURCE, message("CSRC", `1.${100 + i}`, `m${i}`)));
+  }
+  pending.push(relay.handleMessage(SOURCE, message("CSRC", "1.200", "reply", { thread_ts: "1.115" })));
+  await Promise.all(pending);
+
+  // Everything queued before the first post is batched, at most 20 messages per post
+  assert.deepEqual(
+    posts.map((p) => p.text.split("\n").length),
+    [20, 10, 1]
+  );
+  assert.deepEqual(
+    posts.slice(0, 2).flatMap((p) => p.text.split("\n")),
+    Array.from({ length: 30 }, (_, i) => `[test-channel] Name-UHUMAN: m${i}`)
+  );
+  assert.equal(posts[2].text, "[test-channel] Name-UHUMAN: reply");
+  assert.equal(posts[2].thread_ts, posts[0].ts);
+  assert.equal(calls.users, 1);
+});
+
+test("caps each batch by characters and truncates an oversized message", async () => {
+  const { relay, posts } = makeHarness();
+  const long = "x".repeat(1500);
+  await Promise.all(
+    ["1.100", "1.101", "1.102", "1.103", "1.104"].map((ts) => relay.handleMessage(SOURCE, message("CSRC", ts, long)))
+  );
+  assert.deepEqual(
+    posts.map((p) => p.text.split("\n").length),
+    [2, 2, 1]
+  );
+  assert.ok(posts.every((p) => p.text.length <= 4000));
+
+  await relay.handleMessage(SOURCE, message("CSRC", "1.200", "y".repeat(45000)));
+  assert.equal(posts[3].text.length, 40000);
+  assert.ok(posts[3].text.endsWith("y…"));
+});
+
+test("replies to a batched post thread under its first message", async () => {
+  const { relay, posts } = makeHarness({ postDelay: () => 5 });
+  const first = relay.handleMessage(SOURCE, message("CSRC", "1.100", "first"));
+  await new Promise((resolve) => setTimeout(resolve, 1));
+  await Promise.all([
+    first,
+    relay.handleMessage(SOURCE, message("CSRC", "1.101", "second")),
+    relay.handleMessage(SOURCE, message("CSRC", "1.102", "third")),
+  ]);
+  assert.equal(posts.length, 2);
+  await relay.handleMessage(TARGET, message("CDST", "3.100", "answer", { thread_ts: posts[1].ts }));
+  assert.equal(posts[2].channel, "CSRC");
+  assert.equal(posts[2].thread_ts, "1.101");
+});
+
+test("posts a batch's parents before the replies that need them", async () => {
+  const { relay, posts } = makeHarness({ postDelay: () => 5 });
+  const warmUpSent = relay.handleMessage(SOURCE, message("CSRC", "1.100", "warm-up"));
+  await new Promise((resolve) => setTimeout(resolve, 1));
+  await Promise.all([
+    warmUpSent,
+    relay.handleMessage(SOURCE, message("CSRC", "1.101", "parent a")),
+    relay.handleMessage(SOURCE, message("CSRC", "1.102", "on a", { thread_ts: "1.101" })),
+    relay.handleMessage(SOURCE, message("CSRC", "1.103", "on warm-up", { thread_ts: "1.100" })),
+    relay.handleMessage(SOURCE, message("CSRC", "1.104", "parent b")),
+    relay.handleMessage(SOURCE, message("CSRC", "1.105", "more on a", { thread_ts: "1.101" })),
+  ]);
+  const byText = Object.fromEntries(posts.map((p) => [p.text, p]));
+  const warmUp = byText["[test-channel] Name-UHUMAN: warm-up"];
+  const parents = byText["[test-channel] Name-UHUMAN: parent a\n[test-channel] Name-UHUMAN: parent b"];
+  const onA = byText["[test-channel] Name-UHUMAN: on a\n[test-channel] Name-UHUMAN: more on a"];
+  assert.equal(posts.length, 4);
+  assert.equal(onA.thread_ts, parents.ts);
+  assert.ok(posts.indexOf(onA) > posts.indexOf(parents));
+  assert.equal(byText["[test-channel] Name-UHUMAN: on warm-up"].thread_ts, warmUp.ts);
+});
+
+test("replies in the other workspace go back into the original thread", async () => {
+  const { relay, posts } = makeHarness();
+  await relay.handleMessage(SOURCE, message("CSRC", "1.100", "parent"));
+  const relayedParent = posts[0];
+  await relay.handleMessage(TARGET, message("CDST", "3.100", "answer", { thread_ts: relayedParent.ts }));
+
+  assert.equal(posts.length, 2);
+  assert.equal(posts[1].teamId, SOURCE);
+  assert.equal(posts[1].channel, "CSRC");
+  assert.equal(posts[1].thread_ts, "1.100");
+});
+
+test("suppresses the relay's own posts but not humans using the same prefix", async () => {
+  const { relay, posts } = makeHarness();
+  await relay.handleMessage(SOURCE, message("CSRC", "1.100", "hello"));
+  const relayed = posts[0];
+
+  // Echo after chat.postMessage resolved: known from the ts map
+  await relay.handleMessage(TARGET, message("CDST", relayed.ts, relayed.text, { user: "UHUMAN" }));
+  // Echo racing chat.postMessage: prefixed and posted by the target token owner
+  await relay.handleMessage(TARGET, message("CDST", "3.999", "[test-channel] Name-UHUMAN: hello", { user: "UDSTBOT" }));
+  assert.equal(posts.length, 1);
+
+  await relay.handleMessage(TARGET, message("CDST", "3.100", "[test-channel] quoting the bridge", { user: "UOTHER" }));
+  assert.equal(posts.length, 2);
+  assert.equal(posts[1].channel, "CSRC");
+});
+
+test("skips bot messages and non-relayable subtypes", async () => {
+  const { relay, posts } = makeHarness();
+  await relay.handleMessage(SOURCE, message("CSRC", "1.100", "from a bot", { bot_id: "B1" }));
+  await relay.handleMessage(SOURCE, message("CSRC", "1.101", "edited", { subtype: "message_changed" }));
+  assert.equal(posts.length, 0);
+});
+
+test("ignores channels without a rule before looking anything up", async () => {
+  const { relay, posts, calls } = makeHarness();
+  await relay.handleMessage(SOURCE, message("COTHER", "1.100", "not bridged"));
+  assert.equal(posts.length, 0);
+  assert.equal(calls.users, 0);
+  assert.equal(calls.auth, 0);
+});
+
+test("includes shared files in the relayed text", async () => {
+  const { relay, posts } = makeHarness();
+  await relay.handleMessage(
+    SOURCE,
+    message("CSRC", "1.100", "", {
+      subtype: "file_share",
+      files: [{ name: "report.pdf", permalink: "https://example.slack.com/files/report.pdf" }],
+    })
+  );
+  assert.equal(posts[0].text, "[test-channel] Name-UHUMAN: <https://example.slack.com/files/report.pdf|report.pdf>");
+});
+
+test("keeps active threads past the ttl and labels replies to expired ones", async () => {
+  const day = 24 * 60 * 60;
+  const { relay, posts, clock } = makeHarness({ relayOptions: { tsMapTtlSeconds: 7 * day } });
+  await relay.handleMessage(SOURCE, message("CSRC", "1.100", "active parent"));
+  await relay.handleMessage(SOURCE, message("CSRC", "1.101", "dead parent"));
+
+  for (let i = 0; i < 3; i += 1) {
+    clock.now += 5 * day;
+    await relay.handleMessage(SOURCE, message("CSRC", `1.${200 + i}`, "still going", { thread_ts: "1.100" }));
+  }
+  assert.ok(posts.slice(2).every((p) => p.thread_ts === posts[0].ts));
+
+  await relay.handleMessage(SOURCE, message("CSRC", "1.300", "late reply", { thread_ts: "1.101" }));
+  const late = posts[posts.length - 1];
+  assert.equal(late.thread_ts, undefined);
+  assert.equal(late.text, "[test-channel] Name-UHUMAN (reply in an earlier thread): late reply");
+  assert.equal(relay.tsMap.has(relayKey(SOURCE, "CSRC", "1.101")), false);
+});
+
+test("a slow post holds the channel so later messages cannot overtake it", async () => {
+  const { relay, posts } = makeHarness({
+    postDelay: (args) => (args.text.endsWith("slow") ? 300 : 0),
+    relayOptions: { slowPostWarnMs: 100 },
+  });
+  const slow = relay.handleMessage(SOURCE, message("CSRC", "1.100", "slow"));
+  await new Promise((resolve) => setTimeout(resolve, 1));
+  await Promise.all([
+    slow,
+    relay.handleMessage(SOURCE, message("CSRC", "1.101", "next")),
+    relay.handleMessage(SOURCE, message("CSRC", "1.102", "reply", { thread_ts: "1.100" })),
+  ]);
+  assert.deepEqual(
+    posts.map((p) => p.text),
+    ["[test-channel] Name-UHUMAN: slow", "[test-channel] Name-UHUMAN: next", "[test-channel] Name-UHUMAN: reply"]
+  );
+  assert.equal(posts[2].thread_ts, posts[0].ts);
+});
+
+function rateLimited(retryAfter) {
+  return Object.assign(new Error("rate limited"), { code: "slack_webapi_rate_limited_error", retryAfter });
+}
+
+test("re-queues rate-limited posts at the head of the channel after retry-after", async () => {
+  let limited = 1;
+  const { relay, posts } = makeHarness({
+    postError: () => (limited-- > 0 ? rateLimited(0.2) : null),
+  });
+  const started = Date.now();
+  const first = relay.handleMessage(SOURCE, message("CSRC", "1.100", "parent"));
+  await new Promise((resolve) => setTimeout(resolve, 50));
+  await Promise.all([
+    first,
+    relay.handleMessage(SOURCE, message("CSRC", "1.101", "later")),
+    relay.handleMessage(SOURCE, message("CSRC", "1.102", "reply", { thread_ts: "1.100" })),
+  ]);
+  assert.ok(Date.now() - started >= 200);
+  // The retried parent merged with what arrived meanwhile, still first, and its reply threads under it
+  assert.deepEqual(
+    posts.map((p) => p.text),
+    ["[test-channel] Name-UHUMAN: parent\n[test-channel] Name-UHUMAN: later", "[test-channel] Name-UHUMAN: reply"]
+  );
+  assert.equal(posts[1].thread_ts, posts[0].ts);
+});
+
+test("paces posts per target channel and folds waiting messages into the next post", async () => {
+  const { relay, posts } = makeHarness({ relayOptions: { postsPerSecond: 10, postBurst: 1 } });
+  const started = Date.now();
+  await relay.handleMessage(SOURCE, message("CSRC", "1.100", "a"));
+  await relay.handleMessage(SOURCE, message("CSRC", "1.101", "b"));
+  const pending = [];
+  for (let i = 0; i < 5; i += 1) {
+    pending.push(relay.handleMessage(SOURCE, message("CSRC", `1.${110 + i}`, `c${i}`)));
+  }
+  await Promise.all(pending);
+  // Three posts at 10/s without burst take at least two intervals
+  assert.ok(Date.now() - started >= 180);
+  assert.deepEqual(
+    posts.map((p) => p.text.split("\n").length),
+    [1, 1, 5]
+  );
+});
+
+test("gives up on a message after repeated rate limits", async () => {
+  const { relay, posts } = makeHarness({ postError: () => rateLimited(0.01) });
+  await relay.handleMessage(SOURCE, message("CSRC", "1.100", "never"));
+  assert.equal(posts.length, 0);
+});
+
+test("failed user lookups are retried after a short ttl", async () => {
+  let fail = true;
+  const { relay, clock } = makeHarness({
+    getUserInfo: async (client, userId) => (fail ? {} : { id: userId, name: "Real Name" }),
+  });
+  assert.equal(await relay.getUserName(SOURCE, "U1"), "U1");
+  fail = false;
+  assert.equal(await relay.getUserName(SOURCE, "U1"), "U1");
+  clock.now += 60;
+  assert.equal(await relay.getUserName(SOURCE, "U1"), "Real Name");
+});
+
+test("caps the ts map by entry count as well as age", async () => {
+  const { relay } = makeHarness({ relayOptions: { tsMapMaxEntries: 6 } });
+  for (let i = 0; i < 5; i += 1) {
+    await relay.handleMessage(SOURCE, message("CSRC", `1.${100 + i}`, `m${i}`));
+  }
+  assert.equal(relay.tsMap.size, 6);
+  assert.equal(relay.tsMap.has(relayKey(SOURCE, "CSRC", "1.100")), false);
+  assert.equal(relay.tsMap.has(relayKey(SOURCE, "CSRC", "1.104")), true);
+});
+
+test("persists the ts map as an append log and reloads it", async () => {
+  const dir = fs.mkdtempSync(path.join(os.tmpdir(), "relay-"));
+  const tsMapFile = path.join(dir, "relayTsMap.jsonl");
+  try {
+    const first = makeHarness({ relayOptions: { tsMapFile, flushMs: 60_000 } });
+    await first.relay.handleMessage(SOURCE, message("CSRC", "1.100", "parent"));
+    await first.relay.flushTsMap();
+    const afterFirst = fs.readFileSync(tsMapFile, "utf8");
+    await first.relay.handleMessage(SOURCE, message("CSRC", "1.101", "other"));
+    await first.relay.flushTsMap();
+    // Only the new entries were appended; earlier lines are untouched
+    assert.ok(fs.readFileSync(tsMapFile, "utf8").startsWith(afterFirst));
+    // A crash mid-append leaves a torn last line, which loading skips
+    fs.appendFileSync(tsMapFile, '["TSRC:CSRC:1.9",{"relay');
+
+    const second = makeHarness({ relayOptions: { tsMapFile } });
+    await second.relay.handleMessage(SOURCE, message("CSRC", "1.102", "reply", { thread_ts: "1.100" }));
+    assert.equal(second.posts[0].thread_ts, first.posts[0].ts);
+  } finally {
+    fs.rmSync(dir, { recursive: true, force: true });
+  }
+});
+
+test("compacts the append log once it is mostly stale lines", async () => {
+  const dir = fs.mkdtempSync(path.join(os.tmpdir(), "relay-"));
+  const tsMapFile = path.join(dir, "relayTsMap.jsonl");
+  try {
+    const { relay, posts } = makeHarness({
+      relayOptions: { tsMapFile, flushMs: 60_000, tsMapCompactMinLines: 10, tsMapMaxEntries: 6 },
+    });
+    await relay.handleMessage(SOURCE, message("CSRC", "1.100", "parent"));
+    for (let i = 0; i < 10; i += 1) {
+      await relay.handleMessage(SOURCE, message("CSRC", `1.${200 + i}`, "reply", { thread_ts: "1.100" }));
+    }
+    await relay.flushTsMap();
+    const lines = fs.readFileSync(tsMapFile, "utf8").trim().split("\n");
+    assert.equal(lines.length, relay.tsMap.size);
+    assert.equal(fs.existsSync(`${tsMapFile}.tmp`), false);
+
+    const reloaded = makeHarness({ relayOptions: { tsMapFile } });
+    await reloaded.relay.handleMessage(SOURCE, message("CSRC", "1.300", "late", { thread_ts: "1.100" }));
+    assert.equal(reloaded.posts[0].thread_ts, posts[0].ts);
+  } finally {
+    fs.rmSync(dir, { recursive: true, force: true });
+  }
+});
+
+test("loads relay rules from config, one rule per direction", () => {
+  const aliases = { rtc: "TRTC", beta: "TBETA" };
+  const rules = loadRelayRules(
+    JSON.stringify([
+      { source: "rtc#test-client", target: "beta#test-channel" },
+      { source: "RTC#announcements", target: "T0OTHER#general", bidirectional: false },
+    ]),
+    aliases
+  );
+  assert.deepEqual(
+    rules.map((rule) => `${rule.sourceTeam}#${rule.sourceChannelName} -> ${rule.targetTeam}#${rule.targetChannelName}`),
+    ["TRTC#test-client -> TBETA#test-channel", "TBETA#test-channel -> TRTC#test-client", "TRTC#announcements -> T0OTHER#general"]
+  );
+  assert.equal(rules[0].sourceChannelId, null);
+
+  assert.throws(() => loadRelayRules("{", aliases), /not valid JSON/);
+  assert.throws(() => loadRelayRules("[]", aliases), /non-empty JSON array/);
+  assert.throws(() => loadRelayRules('[{"source":"rtc","target":"beta#x"}]', aliases), /rule 0: source must look like/);
+  assert.throws(() => loadRelayRules('[{"source":"gamma#x","target":"beta#x"}]', aliases), /unknown team "gamma"/);
+  assert.throws(() => loadRelayRules('[{"source":"rtc#x","target":"rtc#x"}]', aliases), /same channel/);
+  assert.throws(
+    () => loadRelayRules('[{"source":"rtc#x","target":"beta#y"},{"source":"beta#y","target":"rtc#x"}]', aliases),
+    /rule 1: TBETA#y -> TRTC#x is listed twice/
+  );
+});